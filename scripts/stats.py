@@ -2,7 +2,6 @@
 https://pypistats.org/packages/akkd-file-tree
 """
 
-import matplotlib.pyplot as plt
 import pandas as pd
 import pypistats
 
@@ -34,6 +33,9 @@ print(output)
 
 chart = data.plot(x='date', y='downloads', figsize=(10, 2))
 
+# Only needed for the chart window, so it isn't loaded before the table prints.
+import matplotlib.pyplot as plt  # noqa: E402
+
 plt.show()
 
 # chart.figure.savefig('overall.png')  # alternatively
@@ -5,22 +5,25 @@
 
 from __future__ import annotations
 
-import copy
-import ctypes
 import datetime
 import faulthandler
+import json
 import math
 import os
 import re
 import signal
-import stat
 import sys
+import time
 
-from argparse import Namespace
-from functools import cached_property
-from typing import Any, Callable, Dict, Generator, Iterator, List, Tuple, Type, TypeVar, Union
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from queue import SimpleQueue
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterator, List, Sequence, Tuple, Union
 
-from _collections_abc import dict_items, dict_keys, dict_values
+
+if TYPE_CHECKING:
+    from argparse import Namespace
 
 
 __all__ = [
@@ -30,22 +33,11 @@ __all__ = [
     'print_file_tree',
 ]
 
-faulthandler.enable()
-
-
 __author__ = 'michaelcbarros@gmail.com'
 
 
-getcwd = os.getcwd if hasattr(os, 'getcwd') else os.getcwd
-
-sys.setrecursionlimit(1_000_000)
-
-
 # region Main Code
 
-T = TypeVar('T')
-
-
 # region Icons
 
 
@@ -56,6 +48,14 @@ class Icons:
     LINK = b'\xf0\x9f\x94\x97'.decode('utf-8')
 
 
+class Indicators:
+    MID = '┣━ '
+    LAST = '┗━ '
+    PIPE = '┃   '
+    SPACE = '    '
+    LAST_SPACE = '     '
+
+
 # endregion Icons
 
 # region utils.py
@@ -107,72 +107,188 @@ def create_file_link_str(path: str, name: str, color_file_type: str | None = Non
     return output
 
 
-error_files = []
+class PatternSet(object):
+    """Searches a list of compiled patterns one at a time, stopping at the first match."""
 
+    def __init__(self, patterns: List[re.Pattern]) -> None:
+        self.patterns = patterns
 
-if os.name == 'nt':
-    from ctypes import create_unicode_buffer, windll, wintypes
-    from ctypes.wintypes import DWORD, LPCWSTR, LPWSTR
+    def search(self, string: str) -> re.Match | None:
+        for pattern in self.patterns:
+            match = pattern.search(string)
 
-    INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
-    ERROR_FILE_NOT_FOUND = 2
-    ERROR_NO_MORE_FILES = 18
-    FILE_ATTRIBUTE_DIRECTORY = 16
-    FILE_ATTRIBUTE_READONLY = 1
-    SECONDS_BETWEEN_EPOCHS = 11644473600  # seconds between 1601-01-01 and 1970-01-01
+            if match is not None:
+                return match
 
-    kernel32 = ctypes.windll.kernel32
+        return None
 
-    _FindFirstFile = kernel32.FindFirstFileW
-    _FindFirstFile.argtypes = [wintypes.LPCWSTR, ctypes.POINTER(wintypes.WIN32_FIND_DATAW)]
-    _FindFirstFile.restype = wintypes.HANDLE
 
-    _FindNextFile = kernel32.FindNextFileW
-    _FindNextFile.argtypes = [wintypes.HANDLE, ctypes.POINTER(wintypes.WIN32_FIND_DATAW)]
-    _FindNextFile.restype = wintypes.BOOL
+def compile_alternation(patterns: List[str]) -> re.Pattern | PatternSet | None:
+    """Fuses patterns into a single alternation so one search covers all of them.
 
-    _FindClose = kernel32.FindClose
-    _FindClose.argtypes = [wintypes.HANDLE]
-    _FindClose.restype = wintypes.BOOL
+    Only patterns without capture groups or inline global flags are fused.
+    Joining patterns renumbers their groups, which would break backreferences
+    and conditionals, and a global flag such as (?i) would apply to the whole
+    alternation (before 3.11 it is only deprecated mid-pattern). Those patterns
+    are searched one by one through a PatternSet.
+    """
 
-    def _attributes_to_mode(attributes: int):
-        """Convert Win32 dwFileAttributes to st_mode. Taken from CPython's
-        Modules/posixmodule.c.
-        """
+    if len(patterns) == 0:
+        return None
 
-        mode = 0
+    compiled = [re.compile(p) for p in patterns]
+
+    if len(compiled) == 1:
+        return compiled[0]
+
+    fusible = [p.pattern for p in compiled if p.groups == 0 and p.flags & ~re.UNICODE == 0]
+    separate = [p for p in compiled if p.groups > 0 or p.flags & ~re.UNICODE != 0]
+
+    if len(fusible) < 2:
+        return PatternSet(compiled)
+
+    fused = re.compile('|'.join(f'(?:{p})' for p in fusible))
+
+    return fused if len(separate) == 0 else PatternSet([fused] + separate)
+
+
+class CachedEntry(object):
+    """Stands in for an os.DirEntry when a directory listing comes from a TreeCache."""
+
+    __slots__ = ('name', 'path', '_is_dir', '_stat')
+
+    def __init__(self, name: str, path: str, is_dir: bool) -> None:
+        self.name = name
+        self.path = path
+        self._is_dir = is_dir
+        self._stat: os.stat_result | None = None
+
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        return self._is_dir
+
+    def stat(self, follow_symlinks: bool = True) -> os.stat_result:
+        if self._stat is None:
+            self._stat = os.stat(self.path, follow_symlinks=False)
+
+        return self._stat
+
+
+class TreeCache(object):
+    """Directory listings persisted in a sqlite file between runs.
+
+    A listing is reused for as long as the directory's mtime is unchanged, since
+    adding, removing or renaming an entry always updates it. Only names and
+    folder flags are stored; stat data is always read fresh.
+
+    Filesystem timestamps are coarse (a kernel tick on ext4, 1-2 seconds on
+    FAT, HFS+ and some network filesystems), so a directory changed within the
+    same tick as its scan could change again without its mtime moving. Like git's
+    racy-entry check, listings whose mtime is within RACY_WINDOW_NS of the scan
+    are not stored and get rescanned next time.
+
+    Rows under the scanned root are loaded up front and new listings are written
+    back on close, so get/put can be called from the scanning threads without
+    touching sqlite.
+    Paths are keyed by their raw bytes, since names that aren't valid UTF-8
+    decode to lone surrogates that sqlite can't store as text.
+    """
+
+    RACY_WINDOW_NS = 2_000_000_000
+
+    def __init__(self, path: str, root: str) -> None:
+        import sqlite3
+
+        self.path = path
+        self.root = root
+        self._connection = sqlite3.connect(path)
+
+        self._connection.execute('CREATE TABLE IF NOT EXISTS listings (path BLOB PRIMARY KEY, mtime INTEGER, entries TEXT)')
+
+        # Everything below the root sorts between its "/"-terminated prefix and
+        # that prefix with the last byte bumped, so the primary key index can
+        # serve the range without touching other roots' rows.
+        root_bytes = os.fsencode(root)
+        sep = os.fsencode(os.sep)
+        prefix = root_bytes if root_bytes.endswith(sep) else root_bytes + sep
+        prefix_end = prefix[:-1] + bytes([prefix[-1] + 1])
+
+        rows = self._connection.execute('SELECT path, mtime, entries FROM listings WHERE path = ? OR (path >= ? AND path < ?)', (root_bytes, prefix, prefix_end))
+
+        self._listings: Dict[str, Tuple[int, str]] = {os.fsdecode(row[0]): (row[1], row[2]) for row in rows}
+        self._updates: Dict[str, Tuple[int, str]] = {}
+
+    def get(self, path: str, mtime: int) -> List[Tuple[str, bool]] | None:
+        listing = self._listings.get(path)
+
+        if listing is None or listing[0] != mtime:
+            return None
+
+        return json.loads(listing[1])
+
+    def put(self, path: str, mtime: int, scanned_at: int, entries: List[Tuple[str, bool]]) -> None:
+        if mtime >= scanned_at - self.RACY_WINDOW_NS:
+            return
+
+        self._updates[path] = (mtime, json.dumps(entries))
+
+    def close(self) -> None:
+        if len(self._updates) > 0:
+            with self._connection:
+                self._connection.executemany('INSERT OR REPLACE INTO listings (path, mtime, entries) VALUES (?, ?, ?)',
+                                             [(os.fsencode(path), mtime, entries) for path, (mtime, entries) in self._updates.items()])
+
+        self._connection.close()
+
+
+AHO_CORASICK_MIN_NAMES = 8
 
-        if attributes & FILE_ATTRIBUTE_DIRECTORY:
-            mode |= stat.S_IFDIR | 0o111
-        else:
-            mode |= stat.S_IFREG
-        if attributes & FILE_ATTRIBUTE_READONLY:
-            mode |= 0o444
-        else:
-            mode |= 0o666
 
-        return mode
+class NameAutomaton(object):
+    """Substring matcher over a set of names backed by a pyahocorasick automaton.
 
-    def _filetime_to_time(filetime: Any) -> int:
-        total = filetime.dwHighDateTime << 32 | filetime.dwLowDateTime
+    Scans a string once regardless of how many names there are, where an
+    alternation of escaped names is tried name by name at every position.
+    """
 
-        return total / 10000000.0 - SECONDS_BETWEEN_EPOCHS
+    def __init__(self, names: List[str]) -> None:
+        import ahocorasick
 
-    def find_data_to_stat(data: Any) -> os.stat_result:
-        st_mode = _attributes_to_mode(data.dwFileAttributes)
-        st_ino = 0
-        st_dev = 0
-        st_nlink = 0
-        st_uid = 0
-        st_gid = 0
-        st_size = data.nFileSizeHigh << 32 | data.nFileSizeLow
-        st_atime = _filetime_to_time(data.ftLastAccessTime)
-        st_mtime = _filetime_to_time(data.ftLastWriteTime)
-        st_ctime = _filetime_to_time(data.ftCreationTime)
+        self.automaton = ahocorasick.Automaton()
 
-        st = os.stat_result((st_mode, st_ino, st_dev, st_nlink, st_uid, st_gid, st_size, st_atime, st_mtime, st_ctime))
+        for name in names:
+            self.automaton.add_word(name, name)
 
-        return st
+        self.automaton.make_automaton()
+
+    def search(self, string: str) -> str | None:
+        for _, name in self.automaton.iter(string):
+            return name
+
+        return None
+
+
+def compile_name_matcher(names: List[str]) -> re.Pattern | PatternSet | NameAutomaton | None:
+    """Builds the substring matcher for exclude names.
+
+    Large sets use a NameAutomaton when pyahocorasick is installed, otherwise the
+    names are fused into a single escaped alternation.
+    """
+
+    if len(names) >= AHO_CORASICK_MIN_NAMES and '' not in names:
+        try:
+            return NameAutomaton(names)
+        except ImportError:
+            pass
+
+    return compile_alternation([re.escape(name) for name in names])
+
+
+error_files = []
+
+
+if os.name == 'nt':
+    from ctypes import create_unicode_buffer, windll
+    from ctypes.wintypes import DWORD, LPCWSTR, LPWSTR
 
     def get_short_path_name(long_name: str) -> str:
         """
@@ -223,135 +339,17 @@ if os.name == 'nt':
             else:
                 output_buf_size = needed
 
-    def listdir_stat(dirname='.', glob: str | None = None) -> Generator[Tuple[str, os.stat_result], Any, None]:
-        dirname = os.path.abspath(dirname)
-        dirname = get_short_path_name(dirname) if len(dirname) >= 256 else dirname
-
-        filename = os.path.join(dirname, glob or '*')
-
-        data = wintypes.WIN32_FIND_DATAW()
-        data_p = ctypes.byref(data)
-
-        handle = _FindFirstFile(filename, data_p)
-
-        if handle == INVALID_HANDLE_VALUE:
-            error = ctypes.GetLastError()
-
-            if error == ERROR_FILE_NOT_FOUND:
-                return
-
-            error = ctypes.WinError()
-
-            error_files.append({
-                'filename': filename,
-                'error': str(error)
-            })
-
-            raise error
-        try:
-            while True:
-                if data.cFileName not in ('.', '..'):
-                    st = find_data_to_stat(data)
-                    is_symlink = stat.S_ISLNK(st.st_mode)
-
-                    # yield (data.cFileName, st, is_symlink)
-                    yield (data.cFileName, st)
-
-                success = _FindNextFile(handle, data_p)
-
-                if not success:
-                    error = ctypes.GetLastError()
-
-                    if error == ERROR_NO_MORE_FILES:
-                        break
-
-                    raise ctypes.WinError()
-        finally:
-            if not _FindClose(handle):
-
-                raise ctypes.WinError()
-
-# Linux/posix -- this is only half-tested and doesn't work at the moment, but
-# leaving here for future use
+    def scandir_path(dirname: str) -> str:
+        return get_short_path_name(dirname) if len(dirname) >= 256 else dirname
 else:
-    import ctypes
-    import ctypes.util
-
-    class DIR(ctypes.Structure):
-        pass
-
-    DIR_p = ctypes.POINTER(DIR)
-
-    class dirent(ctypes.Structure):
-        _fields_ = (
-            ('d_ino', ctypes.c_long),
-            ('d_off', ctypes.c_long),
-            ('d_reclen', ctypes.c_ushort),
-            ('d_type', ctypes.c_byte),
-            ('d_name', ctypes.c_char * 256)
-        )
-
-    dirent_p = ctypes.POINTER(dirent)
-
-    _libc = ctypes.CDLL(ctypes.util.find_library('c'))
-    _opendir = _libc.opendir
-    _opendir.argtypes = [ctypes.c_char_p]
-    _opendir.restype = DIR_p
-
-    _readdir = _libc.readdir
-    _readdir.argtypes = [DIR_p]
-    _readdir.restype = dirent_p
-
-    _closedir = _libc.closedir
-    _closedir.argtypes = [DIR_p]
-    _closedir.restype = ctypes.c_int
-
-    DT_DIR = 4
-
-    def find_data_to_stat(data: Any) -> os.stat_result:
-        if data == DT_DIR:
-            st_mode = stat.S_IFDIR | 0o111
-        else:
-            st_mode = stat.S_IFREG
-
-        st_ino = 0
-        st_dev = 0
-        st_nlink = 0
-        st_uid = 0
-        st_gid = 0
-        st_size = 0
-        st_atime = None
-        st_mtime = None
-        st_ctime = None
-
-        st = os.stat_result((st_mode, st_ino, st_dev, st_nlink, st_uid, st_gid, st_size, st_atime, st_mtime, st_ctime))  # type: ignore
-
-        return st
-
-    def listdir_stat(dirname=b'.', glob: str | None = None) -> Generator[Tuple[str, os.stat_result], Any, None]:
-        dir_p = _opendir(dirname)
-
-        try:
-            while True:
-                p = _readdir(dir_p)
-
-                if not p:
-                    break
-
-                name: str = p.contents.d_name
-
-                if name not in (b'.', b'..'):
-                    st = find_data_to_stat(p.contents.d_type)
-
-                    yield (name, st)
-        finally:
-            _closedir(dir_p)
+    def scandir_path(dirname: str) -> str:
+        return dirname
 
 
 # endregion utils.py
 
 
-def get_obj_index(children: List[File | Folder], item_to_find: File | Folder) -> int:
+def get_obj_index(children: Sequence[File | Folder], item_to_find: File | Folder) -> int:
     for i, item in enumerate(children):
         if item.path == item_to_find.path:
             return i
@@ -359,23 +357,36 @@ def get_obj_index(children: List[File | Folder], item_to_find: File | Folder) ->
         return -1
 
 
-class File(dict):
-    def __init__(self, path: str | bytes, parent: 'Folder' | None, stat_obj: os.stat_result) -> None:
+class File(object):
+    __slots__ = ('path', 'name', 'type', 'parent', '_entry', '_stat')
+
+    def __init__(self, path: str | bytes, parent: 'Folder' | None, stat_obj: os.stat_result | None = None, entry: os.DirEntry | None = None, name: str | bytes | None = None) -> None:
         self.path = path
-        self.name = os.path.basename(self.path)
+        self.name = os.path.basename(self.path) if name is None else name
         self.type = type(self).__name__
         self.parent = parent
-        self.stat_obj = stat_obj
+        self._entry = entry
+        self._stat = stat_obj
+
+    @property
+    def stat_obj(self) -> os.stat_result:
+        if self._stat is None:
+            if self._entry is not None:
+                self._stat = self._entry.stat(follow_symlinks=False)
+            else:
+                self._stat = os.stat(self.path, follow_symlinks=False)
+
+        return self._stat
 
     @property
     def size(self) -> int:
         return self.stat_obj.st_size
 
-    @size.setter
-    def size(self, value: int):
-        pass
+    @property
+    def mtime(self) -> float:
+        return self.stat_obj.st_mtime
 
-    @cached_property
+    @property
     def key_path(self) -> List[int]:
         key_path = []
 
@@ -388,77 +399,39 @@ class File(dict):
 
         return list(reversed(key_path))
 
-    @cached_property
-    def index(self):
+    @property
+    def index(self) -> int:
         if self.parent is not None:
-            for i, item in enumerate(self.parent.children):
-                if item.path == self.path:
-                    return i
+            return get_obj_index(self.parent.children, self)
 
         return -1
 
     def remove(self):
-        self.parent.children.pop(self.index)
+        index = self.index
+        children = self.parent.children
 
+        self.parent.children = children[:index] + children[index + 1:]
         self.parent = None
 
-    def __setitem__(self, key: Any, item: Any) -> None:
-        self.__dict__[key] = item
-
-    def __getitem__(self, key: Any) -> Any:
-        return self.__dict__[key]
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'name': self.name,
+            'type': self.type,
+        }
 
     def __repr__(self) -> str:
-        return repr(self.__dict__)
-
-    def __len__(self) -> int:
-        return len(self.__dict__)
-
-    def __delitem__(self, key: Any) -> None:
-        del self.__dict__[key]
-
-    def clear(self) -> None:
-        return self.__dict__.clear()
-
-    def copy(self: T) -> T:
-        return copy.deepcopy(self)
-
-    def has_key(self, k: Any) -> bool:
-        return k in self.__dict__
-
-    def update(self, *args: Any, **kwargs: Any) -> None:
-        return self.__dict__.update(*args, **kwargs)
-
-    def keys(self) -> dict_keys[str, Any]:
-        return self.__dict__.keys()
-
-    def values(self) -> dict_values[str, Any]:
-        return self.__dict__.values()
-
-    def items(self) -> dict_items[str, Any]:
-        return self.__dict__.items()
-
-    def pop(self, *args: Any) -> Any:
-        return self.__dict__.pop(*args)
-
-    def __cmp__(self, dict_: Dict[Any, Any]) -> Any:
-        return self.__cmp__(self.__dict__, dict_)  # type: ignore
-
-    def __contains__(self, item: Any) -> bool:
-        return item in self.__dict__
-
-    def __iter__(self) -> Iterator[Any]:
-        return iter(self.__dict__)
-
-    def __unicode__(self) -> str:
-        return str(repr(self.__dict__))
+        return f'{self.type}({self.path!r})'
 
 
 class Folder(File):
-    def __init__(self, path: str | bytes, parent: 'Folder' | None, stat_obj: os.stat_result, is_root: bool = False) -> None:
-        super(Folder, self).__init__(path, parent, stat_obj)
+    __slots__ = ('children', 'is_root')
+
+    def __init__(self, path: str | bytes, parent: 'Folder' | None, stat_obj: os.stat_result | None = None, is_root: bool = False, entry: os.DirEntry | None = None, name: str | bytes | None = None) -> None:
+        super(Folder, self).__init__(path, parent, stat_obj, entry, name)
 
-        self.children: List[File | Folder] = []
+        # Filled in once when the folder is scanned; folders come before files.
+        self.children: Tuple[File | Folder, ...] = ()
         self.is_root = is_root
 
     @property
@@ -479,18 +452,14 @@ class Folder(File):
 
         return sum(file_sizes)
 
-    @size.setter
-    def size(self, value: int):
-        pass
-
     @property
     def nested_child_count(self) -> Tuple[int, int]:
-        queue: List[Folder] = [self]
+        queue: Deque[Folder] = deque([self])
         folder_count = 0
         file_count = 0
 
         while queue:
-            current_folder: Folder = queue.pop(0)
+            current_folder: Folder = queue.popleft()
 
             for child in current_folder.children:
                 if isinstance(child, Folder):
@@ -501,47 +470,101 @@ class Folder(File):
 
         return folder_count, file_count
 
-    @nested_child_count.setter
-    def nested_child_count(self, value: Tuple[int, int]):
-        pass
+    def to_dict(self) -> Dict[str, Any]:
+        output = super(Folder, self).to_dict()
+
+        output['is_root'] = self.is_root
+        output['children'] = []
+
+        return output
 
     def walk_create_output_str(self, callback: Callable[[Union[File, Folder], int, bool, bool, str], None], level: int = 0, prefix: str = '', remove_pipe: bool = False) -> None:
+        for args in self.iter_output_items(level=level, prefix=prefix, remove_pipe=remove_pipe):
+            callback(*args)
+
+    def iter_output_items(self, level: int = 0, prefix: str = '', remove_pipe: bool = False) -> Iterator[Tuple[File | Folder, int, bool, bool, str]]:
         if self.is_root:
-            callback(self, level, False, False, prefix)
+            yield self, level, False, False, prefix
+
+        mid_segment = Indicators.SPACE if remove_pipe else Indicators.PIPE
+
+        # The prefix is kept as one segment per open folder. Segments are appended
+        # when descending and truncated when the walk climbs back up, so it is
+        # only rebuilt when the depth changes rather than copied for every child.
+        prefix_parts: List[str] = [prefix]
+        stack: List[Tuple[File | Folder, int, bool, bool, int]] = []
+
+        def push_children(folder: Folder, level: int) -> None:
+            depth = len(prefix_parts)
+            children = folder.children
+            last = len(children) - 1
+            has_siblings = last > 0
+
+            for idx in range(last, -1, -1):
+                child = children[idx]
+                is_last = idx == last
+                is_mid_child = isinstance(child, Folder) and has_siblings and not is_last
 
-        for idx, child in enumerate(self.children):
-            is_last = idx == len(self.children) - 1
-            is_mid_child = child.type == 'Folder' and len(self.children) > 1 and idx != len(self.children) - 1
+                stack.append((child, level, is_last, is_mid_child, depth))
+
+        push_children(self, level)
+
+        while stack:
+            child, level, is_last, is_mid_child, depth = stack.pop()
+
+            if depth < len(prefix_parts):
+                del prefix_parts[depth:]
+
+                prefix = ''.join(prefix_parts)
 
             if isinstance(child, Folder):
-                if is_mid_child:
-                    tmp_prefix = prefix + ('    ' if remove_pipe else '┃   ')
-                else:
-                    tmp_prefix = prefix + '     '
+                yield child, level + 1, is_last, is_mid_child, prefix
+
+                segment = mid_segment if is_mid_child else Indicators.LAST_SPACE
 
-                callback(child, level + 1, is_last, is_mid_child, prefix)
+                prefix_parts.append(segment)
 
-                child.walk_create_output_str(callback=callback,
-                                             level=level + 1,
-                                             prefix=tmp_prefix,
-                                             remove_pipe=remove_pipe)
+                prefix += segment
+
+                push_children(child, level + 1)
             else:
-                callback(child, level, is_last, is_mid_child, prefix)
+                yield child, level, is_last, is_mid_child, prefix
 
     def walk(self, callback: Callable[[File | Folder, int, bool, bool], File | Folder | Any], level: int = 0) -> None:
         if self.is_root:
             callback(self, level, False, False)
 
-        for idx, child in enumerate(self.children):
-            is_last = idx == len(self.children) - 1
-            is_mid_child = isinstance(child, Folder) and len(self.children) > 1 and idx != len(self.children) - 1
+        stack: List[Tuple[Folder, int, File | Folder, int, bool, bool]] = []
+
+        def push_children(folder: Folder, level: int) -> None:
+            children = folder.children
+            last = len(children) - 1
+            has_siblings = last > 0
+
+            for idx in range(last, -1, -1):
+                child = children[idx]
+                is_last = idx == last
+                is_mid_child = isinstance(child, Folder) and has_siblings and not is_last
+
+                stack.append((folder, idx, child, level, is_last, is_mid_child))
+
+        push_children(self, level)
+
+        while stack:
+            parent, idx, child, level, is_last, is_mid_child = stack.pop()
 
             if isinstance(child, Folder):
-                self.children[idx] = callback(child, level + 1, is_last, is_mid_child)
+                result = callback(child, level + 1, is_last, is_mid_child)
 
-                child.walk(callback=callback, level=level + 1)
+                push_children(child, level + 1)
             else:
-                self.children[idx] = callback(child, level, is_last, is_mid_child)
+                result = callback(child, level, is_last, is_mid_child)
+
+            if result is not child:
+                parent.set_child(idx, result)
+
+    def set_child(self, index: int, item: File | Folder) -> None:
+        self.children = self.children[:index] + (item,) + self.children[index + 1:]
 
 
 class FileTreeMaker(object):
@@ -558,103 +581,230 @@ class FileTreeMaker(object):
                  later_than_date: str = None,
                  links: bool = False,
                  show_size: bool = False,
-                 show_counts: bool = False) -> None:
+                 show_counts: bool = False,
+                 threads: int | None = None,
+                 cache_path: str | None = None) -> None:
         global error_files
 
         error_files = []
 
-        self.root = os.path.abspath(root)
-        self.exclude_folder = exclude_folder
+        self.root = os.path.abspath(os.fsdecode(root))
+        self.exclude_folder = frozenset(exclude_folder)
         self.exclude_name = exclude_name
         self.exclude_regex = [re.compile(str(p)) for p in exclude_regex]
         self.include_regex = [re.compile(str(p)) for p in include_regex]
+        self._exclude_name_re = compile_name_matcher([str(n) for n in exclude_name])
+        self._exclude_regex_re = compile_alternation([p.pattern for p in self.exclude_regex])
         self.max_level = max_level
         self.remove_pipe = remove_pipe
         self.size_limit = size_limit
         self.exclude_empty_files = exclude_empty_files
         self.later_than_date = later_than_date
+        self._later_than_timestamp = datetime.datetime.strptime(later_than_date, '%Y-%m-%d').timestamp() if later_than_date is not None else None
         self.links = links
         self.show_size = show_size
         self.show_counts = show_counts
+        if threads is not None and threads < 1:
+            raise ValueError(f'threads must be at least 1, got {threads}')
+
+        self.threads = threads
+        self.cache_path = cache_path
+        self._use_dir_fd = os.scandir in os.supports_fd and hasattr(os, 'O_DIRECTORY')
+        self._prefetch_stat = show_size or size_limit > -1 or exclude_empty_files or later_than_date is not None
 
         self.root_dir_tree = self.make_dir_tree()
 
         if len(self.include_regex) > 0:
             self.remove_empty_dirs()
 
-    def _recurse(self, parent_path: str | bytes, file_list: List[Tuple[str | bytes, os.stat_result]], level: int, dir_tree: Folder) -> None:
-        if len(file_list) == 0 or (self.max_level != -1 and self.max_level <= level):
-            return
+    def _scan_dir(self, path: str) -> List[Tuple[os.DirEntry | CachedEntry, os.stat_result | None]]:
+        if self._cache is not None:
+            scanned_at = time.time_ns()
+            mtime = os.stat(path).st_mtime_ns
+            listing = self._cache.get(path, mtime)
+
+            if listing is not None:
+                path_prefix = path if path.endswith(os.sep) else path + os.sep
+
+                return self._stat_entries([CachedEntry(name, path_prefix + name, is_dir) for name, is_dir in listing])
+
+        if self._use_dir_fd:
+            # Scanning through a directory fd makes every stat an fstatat relative
+            # to that fd instead of a full path lookup from the root.
+            dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+
+            try:
+                results = self._stat_entries(self._read_entries(dir_fd))
+            finally:
+                os.close(dir_fd)
         else:
-            file_list.sort(key=lambda f: not stat.S_ISDIR(f[1].st_mode))
+            results = self._stat_entries(self._read_entries(scandir_path(path)))
 
-            for idx, file_obj in enumerate(file_list):
-                try:
-                    sub_path = file_obj[0]
-                    stat_obj = file_obj[1]
-                    full_path = os.path.join(parent_path, sub_path)  # type: ignore
-                    fize_size = -1
+        if self._cache is not None:
+            self._cache.put(path, mtime, scanned_at, [(entry.name, entry.is_dir(follow_symlinks=False)) for entry, _ in results])
 
-                    if self.later_than_date is not None and not stat.S_ISDIR(stat_obj.st_mode) and datetime.datetime.fromtimestamp(os.path.getmtime(full_path)) < datetime.datetime.strptime(self.later_than_date, '%Y-%m-%d'):
-                        continue
+        return results
 
-                    if self.size_limit > -1 or self.exclude_empty_files:
-                        fize_size = 0 if stat.S_ISDIR(stat_obj.st_mode) else stat_obj.st_size if stat_obj.st_size is not None else os.path.getsize(full_path)
+    def _read_entries(self, path: str | int) -> List[os.DirEntry]:
+        # Folders are listed before files; a single partitioning pass keeps the
+        # listing order within each group without sorting.
+        folders: List[os.DirEntry] = []
+        files: List[os.DirEntry] = []
+
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry)
+                else:
+                    files.append(entry)
 
-                    if self.size_limit > -1 and fize_size > self.size_limit:
-                        continue
+        return folders + files
 
-                    if self.exclude_empty_files and fize_size == 0:
-                        continue
+    def _stat_entries(self, entries: List[os.DirEntry | CachedEntry]) -> List[Tuple[os.DirEntry | CachedEntry, os.stat_result | None]]:
+        results: List[Tuple[os.DirEntry | CachedEntry, os.stat_result | None]] = []
 
-                    if any(exclude_name in sub_path for exclude_name in self.exclude_name):  # type: ignore
-                        continue
+        for entry in entries:
+            stat_obj = None
+
+            if self._prefetch_stat:
+                try:
+                    stat_obj = entry.stat(follow_symlinks=False)
+                except OSError:
+                    # Raised again, and handled, when the entry is processed.
+                    pass
+
+            results.append((entry, stat_obj))
+
+        return results
+
+    def _add_entries(self, parent_path: str, dir_tree: Folder, level: int, entries: List[Tuple[os.DirEntry | CachedEntry, os.stat_result | None]]) -> List[Tuple[str, Folder, int]]:
+        # This runs once per entry in the tree, so attribute lookups are hoisted
+        # into locals ahead of the loop.
+        sub_folders: List[Tuple[str, Folder, int]] = []
+        children: List[File | Folder] = []
+        add_child = children.append
+        add_sub_folder = sub_folders.append
+        # Children are joined onto a prefix built once per directory rather than
+        # going through os.path.join for every entry.
+        parent_prefix = parent_path if parent_path.endswith(os.sep) else parent_path + os.sep
+        exclude_folder = self.exclude_folder
+        exclude_name_re = self._exclude_name_re
+        exclude_regex_re = self._exclude_regex_re
+        include_regex = self.include_regex
+        prefetch_stat = self._prefetch_stat
+        later_than_timestamp = self._later_than_timestamp
+        size_limit = self.size_limit
+        exclude_empty_files = self.exclude_empty_files
+        use_dir_fd = self._use_dir_fd
+        sub_level = level + 1
+
+        for entry, stat_obj in entries:
+            try:
+                sub_path = entry.name
+                full_path = parent_prefix + sub_path
+                is_dir = entry.is_dir(follow_symlinks=False)
+                fize_size = -1
+
+                if is_dir and sub_path in exclude_folder:
+                    continue
+
+                if prefetch_stat and stat_obj is None:
+                    stat_obj = os.stat(full_path, follow_symlinks=False)
+
+                if later_than_timestamp is not None and not is_dir and stat_obj.st_mtime < later_than_timestamp:
+                    continue
+
+                if size_limit > -1 or exclude_empty_files:
+                    fize_size = 0 if is_dir else stat_obj.st_size
+
+                if size_limit > -1 and fize_size > size_limit:
+                    continue
+
+                if exclude_empty_files and fize_size == 0:
+                    continue
+
+                if exclude_name_re is not None and exclude_name_re.search(sub_path) is not None:
+                    continue
+
+                if not is_dir and (len(include_regex) > 0 and all(p.search(full_path) is None for p in include_regex)):
+                    continue
+
+                if exclude_regex_re is not None and exclude_regex_re.search(full_path) is not None:
+                    continue
+
+                # An fd-backed DirEntry can't stat once its directory fd is closed.
+                node_entry = None if use_dir_fd else entry
+
+                if is_dir:
+                    sub_folder = Folder(full_path, parent=dir_tree, stat_obj=stat_obj, entry=node_entry, name=sub_path)
+
+                    add_child(sub_folder)
+                    add_sub_folder((full_path, sub_folder, sub_level))
+                else:
+                    add_child(File(full_path, parent=dir_tree, stat_obj=stat_obj, entry=node_entry, name=sub_path))
+            except OSError as ex:
+                self._handle_os_error(full_path, ex)
 
-                    if not stat.S_ISDIR(stat_obj.st_mode) and (len(self.include_regex) > 0 and all([p.search(full_path) is None for p in self.include_regex])):
-                        continue
+        dir_tree.children = tuple(children)
 
-                    if any([p.search(full_path) is not None for p in self.exclude_regex]):
-                        continue
+        return sub_folders
 
-                    if stat.S_ISDIR(stat_obj.st_mode) and sub_path not in self.exclude_folder:
-                        sub_folder = Folder(full_path, parent=dir_tree, stat_obj=stat_obj)
+    def _recurse(self, parent_path: str, dir_tree: Folder, level: int) -> None:
+        # Directory listings are fetched on worker threads, which release the GIL
+        # while blocked in scandir/stat. Nodes are only ever created here, on the
+        # calling thread, so the tree itself needs no locking.
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            pending: Dict[Future[List[Tuple[os.DirEntry | CachedEntry, os.stat_result | None]]], Tuple[str, Folder, int]] = {}
+            completed: SimpleQueue[Future[List[Tuple[os.DirEntry | CachedEntry, os.stat_result | None]]]] = SimpleQueue()
 
-                        dir_tree.children.append(sub_folder)
+            def submit(parent_path: str, dir_tree: Folder, level: int) -> None:
+                if self.max_level == -1 or self.max_level > level:
+                    future = executor.submit(self._scan_dir, parent_path)
 
-                        try:
-                            self._recurse(parent_path=full_path,
-                                          file_list=list(listdir_stat(full_path)),
-                                          level=level + 1,
-                                          dir_tree=sub_folder)
-                        except FileNotFoundError as fnfe:
-                            print('full_path:', full_path)
-                            print('\n' * 5)
-                            print(fnfe)
-                            sys.exit()
+                    pending[future] = (parent_path, dir_tree, level)
 
-                            raise fnfe
-                        except RecursionError as rex:
-                            print('full_path:', full_path)
-                            print('\n' * 5)
-                            print(rex)
-                            # sys.exit()
+                    future.add_done_callback(completed.put)
 
-                            raise rex
-                    elif not stat.S_ISDIR(stat_obj.st_mode):
-                        file = File(full_path, parent=dir_tree, stat_obj=stat_obj)
+            submit(parent_path, dir_tree, level)
 
-                        dir_tree.children.append(file)
+            while pending:
+                future = completed.get()
+
+                parent_path, dir_tree, level = pending.pop(future)
+
+                try:
+                    entries = future.result()
                 except OSError as ex:
-                    if '[Errno 13] Permission denied' not in str(ex) and '[WinError 5] Access is denied' not in str(ex):
-                        raise ex
+                    self._handle_os_error(parent_path, ex)
+
+                    continue
+
+                for sub_folder in self._add_entries(parent_path, dir_tree, level, entries):
+                    submit(*sub_folder)
+
+    def _handle_os_error(self, path: str, ex: OSError) -> None:
+        error_files.append({
+            'filename': path,
+            'error': str(ex)
+        })
+
+        if not isinstance(ex, FileNotFoundError) and '[Errno 13] Permission denied' not in str(ex) and '[WinError 5] Access is denied' not in str(ex):
+            raise ex
 
     def make_dir_tree(self) -> Folder:
         dir_tree = Folder(self.root, None, os.stat(self.root), True)
 
-        self._recurse(parent_path=self.root,
-                      file_list=list(listdir_stat(self.root)),  # type: ignore
-                      level=0,
-                      dir_tree=dir_tree)
+        self._cache = TreeCache(self.cache_path, self.root) if self.cache_path is not None else None
+
+        try:
+            self._recurse(parent_path=self.root,
+                          dir_tree=dir_tree,
+                          level=0)
+        finally:
+            if self._cache is not None:
+                self._cache.close()
+
+                self._cache = None
 
         return dir_tree
 
@@ -669,15 +819,22 @@ class FileTreeMaker(object):
 
         return temp
 
-    def to_dict(self) -> Dict[str, str | bool | Dict[str, Any]]:
-        def cb(item: File | Folder, level: int, is_last: bool, is_mid_child: bool) -> Dict[str, Any]:
-            return dict(item)
+    def to_dict(self) -> Dict[str, Any]:
+        output = self.root_dir_tree.to_dict()
+        stack: List[Tuple[Folder, Dict[str, Any]]] = [(self.root_dir_tree, output)]
+
+        while stack:
+            folder, folder_dict = stack.pop()
 
-        dir_tree_copy = self.root_dir_tree.copy()
+            for child in folder.children:
+                child_dict = child.to_dict()
 
-        dir_tree_copy.walk(cb)
+                folder_dict['children'].append(child_dict)
 
-        return dict(dir_tree_copy)
+                if isinstance(child, Folder):
+                    stack.append((child, child_dict))
+
+        return output
 
     def remove_empty_dirs(self):
         to_be_removed: List[Folder] = []
@@ -699,68 +856,37 @@ class FileTreeMaker(object):
             for item in to_be_removed:
                 item.remove()
 
-    def to_tree_str(self) -> str:
-        lines = []
-
-        def cb(item: File | Folder, level: int, is_last: bool, is_mid_child: bool, prefix: str) -> None:
-            idc = '┗━' if is_last else '┣━'
-
-            idc = '' if type(item) == Folder and item.is_root else idc
-
-            icon = f'{Icons.FOLDER if type(item) == Folder else Icons.FILE}'
-
-            color_file_type: str | None = None
+    def iter_tree_lines(self) -> Iterator[str]:
+        indicators = (Indicators.MID, Indicators.LAST)
 
+        for item, level, is_last, is_mid_child, prefix in self.root_dir_tree.iter_output_items(remove_pipe=self.remove_pipe):
             if type(item) == Folder:
+                idc = '' if item.is_root else indicators[is_last]
+                icon = Icons.FOLDER
                 color_file_type = 'directory'
-
-            item_name: str = item.name.decode('utf-8') if isinstance(item.name, bytes) else item.name  # type: ignore
-            item_path: str = item.path.decode('utf-8') if isinstance(item.path, bytes) else item.path  # type: ignore
-
-            if self.links:
-                name = '{name}'.format(name=create_file_link_str(item_path, item_name, color_file_type)) if item.type == 'Folder' else create_file_link_str(item_path, item_name, color_file_type)
             else:
-                name = '{name}'.format(name=create_colored_str(item_name, color_file_type)) if item.type == 'Folder' else create_colored_str(item_name, color_file_type)
-
-            size_count_str = get_size_count_str(self, item)
-
-            output = '{prefix}{idc}{space}{icon} {name}{size_count_str}'.format(prefix=prefix,
-                                                                                idc=idc,
-                                                                                space='' if type(item) == Folder and item.is_root else ' ',
-                                                                                icon=icon,
-                                                                                name=name,
-                                                                                size_count_str=size_count_str)
-
-            lines.append(output)
-
-        self.root_dir_tree.walk_create_output_str(cb, remove_pipe=self.remove_pipe)
-
-        output_str = '\n'.join(lines)
-
-        return output_str
-
-    def to_flat_str(self) -> str:
-        lines = []
-
-        def cb(item: Union[File, Folder], level: int, is_last: bool, is_mid_child: bool, prefix: str) -> None:
-            item_path: str = item.path.decode('utf-8') if isinstance(item.path, bytes) else item.path  # type: ignore
+                idc = indicators[is_last]
+                icon = Icons.FILE
+                color_file_type = None
 
             if self.links:
-                name = create_file_link_str(item_path, item_path)
+                name = create_file_link_str(item.path, item.name, color_file_type)
             else:
-                name = item.path
-
-            size_count_str = get_size_count_str(self, item)
+                name = create_colored_str(item.name, color_file_type)
 
-            output = '{name}{size_count_str}'.format(name=name, size_count_str=size_count_str)
+            yield f'{prefix}{idc}{icon} {name}{get_size_count_str(self, item)}'
 
-            lines.append(output)
+    def iter_flat_lines(self) -> Iterator[str]:
+        for item, level, is_last, is_mid_child, prefix in self.root_dir_tree.iter_output_items(remove_pipe=self.remove_pipe):
+            name = create_file_link_str(item.path, item.path) if self.links else item.path
 
-        self.root_dir_tree.walk_create_output_str(cb, remove_pipe=self.remove_pipe)
+            yield f'{name}{get_size_count_str(self, item)}'
 
-        output_str = '\n'.join(lines)
+    def to_tree_str(self) -> str:
+        return '\n'.join(self.iter_tree_lines())
 
-        return output_str
+    def to_flat_str(self) -> str:
+        return '\n'.join(self.iter_flat_lines())
 
 
 def get_size_count_str(file_tree_maker: FileTreeMaker, item: File | Folder):
@@ -784,10 +910,12 @@ def sigint_handler(signum: int, frame: Any):
     sys.exit(0)
 
 
-signal.signal(signal.SIGINT, sigint_handler)
+def run() -> None:
+    # Only installed for the CLI, so importing the package has no process-wide side effects.
+    faulthandler.enable()
 
+    signal.signal(signal.SIGINT, sigint_handler)
 
-def run() -> None:
     res = parse_args()
 
     print_file_tree(**res.__dict__)
@@ -808,7 +936,10 @@ def print_file_tree(root: str | bytes = '.',
                     links: bool = False,
                     show_size: bool = False,
                     show_counts: bool = False,
-                    errors: bool = False) -> None:
+                    errors: bool = False,
+                    threads: int | None = None,
+                    cache: str = None,
+                    clear_cache: bool = False) -> None:
     exclude_folder = list(exclude_folder)
     exclude_name = list(exclude_name)
     exclude_regex = list(exclude_regex)
@@ -816,7 +947,10 @@ def print_file_tree(root: str | bytes = '.',
 
     root = os.path.abspath(root)
 
-    file_tree_maker = FileTreeMaker(root=root.encode('utf-8') if os.name == 'posix' else root,
+    if clear_cache and cache is not None and os.path.exists(cache):
+        os.remove(cache)
+
+    file_tree_maker = FileTreeMaker(root=root,
                                     max_level=max_level,
                                     remove_pipe=remove_pipe,
                                     exclude_folder=exclude_folder,
@@ -828,13 +962,9 @@ def print_file_tree(root: str | bytes = '.',
                                     later_than_date=later_than_date,
                                     links=links,
                                     show_size=show_size,
-                                    show_counts=show_counts)
-
-    output_str = file_tree_maker.to_flat_str() if flat else file_tree_maker.to_tree_str()
-
-    if output is not None:
-        with open(output, 'w') as f_out:
-            f_out.write(output_str)
+                                    show_counts=show_counts,
+                                    threads=threads,
+                                    cache_path=cache)
 
     if links:
         name = 'root: {root}'.format(root=f"\033]8;;file://{root}\033\\{root}\033]8;;\033\\")
@@ -845,10 +975,21 @@ def print_file_tree(root: str | bytes = '.',
 
     root_str = '{name}{size_count_str}'.format(name=name, size_count_str=size_count_str)
 
-    output_str = output_str.replace('�', '')
+    # Lines are streamed to the output file and stdout as they are built, so the
+    # full output is never held in memory.
+    with open(output, 'w') if output is not None else nullcontext() as f_out:
+        print(root_str)
 
-    print(root_str)
-    print(output_str)
+        lines = file_tree_maker.iter_flat_lines() if flat else file_tree_maker.iter_tree_lines()
+        stdout_write = sys.stdout.write
+
+        for idx, line in enumerate(lines):
+            if f_out is not None:
+                f_out.write(f'\n{line}' if idx else line)
+
+            stdout_write(f"{line.replace('�', '')}\n")
+
+        sys.stdout.flush()
 
     if errors and len(error_files) > 0:
         print('')
@@ -882,6 +1023,14 @@ def parse_args() -> Namespace:
 
             setattr(namespace, self.dest, items)
 
+    def positive_int(value: str) -> int:
+        number = int(value)
+
+        if number < 1:
+            raise argparse.ArgumentTypeError(f'must be at least 1, got {number}')
+
+        return number
+
     # Create a parser object
     parser = argparse.ArgumentParser(description='Command Line Parser Example')
 
@@ -905,6 +1054,9 @@ def parse_args() -> Namespace:
     parser.add_argument('-s', '--show-size', default=False, action='store_true', help='Show size of files/folders in terminal')
     parser.add_argument('-c', '--show-counts', default=False, action='store_true', help='Show counts of files/folders in terminal')
     parser.add_argument('-e', '--errors', default=False, action='store_true', help='Display which files had errors')
+    parser.add_argument('-t', '--threads', default=None, type=positive_int, help='Number of threads used to read directories')
+    parser.add_argument('--cache', default=None, type=str, help='Reuse directory listings from this cache file while the directories are unchanged')
+    parser.add_argument('--clear-cache', default=False, action='store_true', help='Delete the cache file before running')
 
     # Parse the command-line arguments
     args = parser.parse_args()
@@ -0,0 +1,57 @@
+import pytest
+
+from file_tree import FileTreeMaker
+from file_tree import _file_tree
+
+
+# Regex metacharacters and overlapping names; at least AHO_CORASICK_MIN_NAMES of them.
+EXCLUDE_NAMES = ['a.b', '(x', '[1]', 'c+', '^z', '$y', '{2}', 'foo', 'foobar', 'oob', 'bar.']
+
+FILE_NAMES = [
+    'a.b.txt',
+    'axb.txt',
+    '(x).txt',
+    'x.txt',
+    '[1].txt',
+    '1.txt',
+    'c+.txt',
+    'cc.txt',
+    '^z.txt',
+    'z.txt',
+    '$y.txt',
+    'y.txt',
+    '{2}.txt',
+    '22.txt',
+    'xfoobarx',
+    'boob',
+    'fo',
+    'bar.txt',
+    'barx',
+    'keep.txt',
+]
+
+KEPT_NAMES = ['1.txt', '22.txt', 'axb.txt', 'barx', 'cc.txt', 'fo', 'keep.txt', 'x.txt', 'y.txt', 'z.txt']
+
+
+def test_automaton_excludes_same_entries_as_alternation(tmp_path, monkeypatch):
+    pytest.importorskip('ahocorasick')
+
+    assert len(EXCLUDE_NAMES) >= _file_tree.AHO_CORASICK_MIN_NAMES
+
+    for name in FILE_NAMES:
+        (tmp_path / name).write_text(name)
+
+    with_automaton = FileTreeMaker(str(tmp_path), exclude_name=EXCLUDE_NAMES)
+
+    monkeypatch.setattr(_file_tree, 'AHO_CORASICK_MIN_NAMES', len(EXCLUDE_NAMES) + 1)
+
+    with_alternation = FileTreeMaker(str(tmp_path), exclude_name=EXCLUDE_NAMES)
+
+    assert isinstance(with_automaton._exclude_name_re, _file_tree.NameAutomaton)
+    assert not isinstance(with_alternation._exclude_name_re, _file_tree.NameAutomaton)
+
+    assert with_automaton.to_flat_str() == with_alternation.to_flat_str()
+    assert sorted(child.name for child in with_automaton.root_dir_tree.children) == KEPT_NAMES
+
+    for name in FILE_NAMES + ['a*b', 'q?', 'foob', 'oo']:
+        assert (with_automaton._exclude_name_re.search(name) is None) == (with_alternation._exclude_name_re.search(name) is None)
@@ -0,0 +1,27 @@
+from file_tree import FileTreeMaker
+from file_tree._file_tree import PatternSet, compile_alternation
+
+
+def test_global_flag_does_not_leak_into_other_patterns(tmp_path):
+    for name in ['bar.txt', 'Bar.txt', 'ZZZ.txt', 'keep.txt']:
+        (tmp_path / name).write_text(name)
+
+    matcher = compile_alternation(['(?i)zzz', 'Bar', 'nope'])
+
+    assert isinstance(matcher, PatternSet)
+    assert matcher.search('/x/bar.txt') is None
+    assert matcher.search('/x/Bar.txt') is not None
+    assert matcher.search('/x/ZZZ.txt') is not None
+
+    file_tree_maker = FileTreeMaker(str(tmp_path), exclude_regex=['(?i)zzz', 'Bar', 'nope'])
+
+    assert sorted(child.name for child in file_tree_maker.root_dir_tree.children) == ['bar.txt', 'keep.txt']
+
+
+def test_backreferences_keep_their_own_groups(tmp_path):
+    for name in ['aa.txt', 'xb.txt', 'keep.txt']:
+        (tmp_path / name).write_text(name)
+
+    file_tree_maker = FileTreeMaker(str(tmp_path), exclude_regex=[r'(x)b', r'(a)\1'])
+
+    assert [child.name for child in file_tree_maker.root_dir_tree.children] == ['keep.txt']
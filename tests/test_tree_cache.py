@@ -0,0 +1,134 @@
+import os
+import time
+
+import pytest
+
+from file_tree import FileTreeMaker, print_file_tree
+from file_tree._file_tree import TreeCache
+
+
+def set_mtime_ns(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def age(path, seconds=60):
+    set_mtime_ns(path, time.time_ns() - seconds * 1_000_000_000)
+
+
+def names(file_tree_maker):
+    return sorted(os.path.relpath(line, file_tree_maker.root) for line in file_tree_maker.to_flat_str().splitlines()[1:])
+
+
+def make_tree(tmp_path):
+    root = tmp_path / 'root'
+
+    (root / 'sub').mkdir(parents=True)
+    (root / 'a.txt').write_text('a')
+    (root / 'sub' / 'b.txt').write_text('b')
+
+    age(root / 'sub')
+    age(root)
+
+    return root
+
+
+def add_file_keeping_mtime(root, name):
+    mtime_ns = os.stat(root).st_mtime_ns
+
+    (root / name).write_text(name)
+
+    set_mtime_ns(root, mtime_ns)
+
+
+def test_unchanged_directory_is_served_from_cache(tmp_path):
+    root = make_tree(tmp_path)
+    cache = str(tmp_path / 'cache.db')
+
+    assert names(FileTreeMaker(str(root), cache_path=cache)) == ['a.txt', 'sub', os.path.join('sub', 'b.txt')]
+
+    # The mtime is unchanged, so the cached listing is used and the new file isn't seen.
+    add_file_keeping_mtime(root, 'c.txt')
+
+    assert names(FileTreeMaker(str(root), cache_path=cache)) == ['a.txt', 'sub', os.path.join('sub', 'b.txt')]
+
+
+def test_changed_directory_is_rescanned(tmp_path):
+    root = make_tree(tmp_path)
+    cache = str(tmp_path / 'cache.db')
+
+    FileTreeMaker(str(root), cache_path=cache)
+
+    (root / 'c.txt').write_text('c')
+    age(root, seconds=30)
+
+    assert names(FileTreeMaker(str(root), cache_path=cache)) == ['a.txt', 'c.txt', 'sub', os.path.join('sub', 'b.txt')]
+
+
+def test_recently_modified_directory_is_not_cached(tmp_path):
+    root = make_tree(tmp_path)
+    cache = str(tmp_path / 'cache.db')
+
+    # Within the racy window of the scan, so the listing must not be stored.
+    set_mtime_ns(root, time.time_ns())
+
+    FileTreeMaker(str(root), cache_path=cache)
+
+    add_file_keeping_mtime(root, 'c.txt')
+
+    assert 'c.txt' in names(FileTreeMaker(str(root), cache_path=cache))
+
+
+def test_clear_cache_removes_stale_listings(tmp_path, capsys):
+    root = make_tree(tmp_path)
+    cache = str(tmp_path / 'cache.db')
+
+    FileTreeMaker(str(root), cache_path=cache)
+
+    add_file_keeping_mtime(root, 'c.txt')
+
+    print_file_tree(str(root), flat=True, cache=cache)
+
+    assert 'c.txt' not in capsys.readouterr().out
+
+    print_file_tree(str(root), flat=True, cache=cache, clear_cache=True)
+
+    assert os.path.join(str(root), 'c.txt') in capsys.readouterr().out.splitlines()
+
+
+def test_undecodable_directory_name_is_cached(tmp_path):
+    root = make_tree(tmp_path)
+    cache = str(tmp_path / 'cache.db')
+    bad = os.path.join(os.fsencode(str(root)), b'bad\xff')
+
+    try:
+        os.mkdir(bad)
+    except OSError:
+        pytest.skip('filesystem rejects non-UTF-8 names')
+
+    age(bad)
+    age(root)
+
+    expected = ['a.txt', os.fsdecode(b'bad\xff'), 'sub', os.path.join('sub', 'b.txt')]
+
+    assert names(FileTreeMaker(str(root), cache_path=cache)) == expected
+    assert names(FileTreeMaker(str(root), cache_path=cache)) == expected
+
+
+def test_only_listings_under_the_root_are_loaded(tmp_path):
+    root = make_tree(tmp_path)
+    sibling = tmp_path / 'rootx'
+    cache = str(tmp_path / 'cache.db')
+
+    (sibling / 'sub').mkdir(parents=True)
+    age(sibling / 'sub')
+    age(sibling)
+
+    FileTreeMaker(str(root), cache_path=cache)
+    FileTreeMaker(str(sibling), cache_path=cache)
+
+    tree_cache = TreeCache(cache, str(root))
+
+    try:
+        assert sorted(tree_cache._listings) == [str(root), str(root / 'sub')]
+    finally:
+        tree_cache.close()